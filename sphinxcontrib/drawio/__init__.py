@@ -1,18 +1,20 @@
+import json
+import mmap
 import os
 import os.path
 import platform
 import shutil
-import subprocess
-from hashlib import sha1
-from pathlib import Path
-from subprocess import Popen, PIPE
-from tempfile import TemporaryFile
-from time import sleep
-from typing import Dict, Any, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from subprocess import DEVNULL, Popen, PIPE
+from tempfile import TemporaryDirectory, TemporaryFile
+from time import monotonic, sleep
+from typing import IO, Dict, Any, List, NamedTuple, Tuple
 from xml.etree import ElementTree as ET
 
 from docutils import nodes
-from docutils.nodes import Node, image as docutils_image
+from docutils.nodes import Node
 from docutils.parsers.rst import directives
 from docutils.parsers.rst.directives.images import Image
 from sphinx.application import Sphinx
@@ -37,9 +39,13 @@ VALID_OUTPUT_FORMATS = {
 }
 
 
+# The platform cannot change while the process runs
+_SYSTEM = platform.system()
+
+
 def is_headless(config: Config):
     if config.drawio_headless == "auto":
-        if platform.system() != "Linux":
+        if _SYSTEM != "Linux":
             # Xvfb can only run on Linux
             return False
         # DISPLAY will exist if an X-server is running
@@ -54,6 +60,10 @@ class DrawIOError(SphinxError):
 
 
 def format_spec(argument: Any) -> str:
+    value = argument.lower().strip() if argument else argument
+    if value in VALID_OUTPUT_FORMATS:
+        return value
+    # Reuse docutils' error message for invalid values
     return directives.choice(argument, list(VALID_OUTPUT_FORMATS.keys()))
 
 
@@ -72,19 +82,14 @@ def is_valid_format(format: str, builder: Builder) -> str:
         return format
 
 
-def boolean_spec(argument: Any) -> bool:
-    if argument == "true":
-        return True
-    elif argument == "false":
-        return False
-    else:
-        raise ValueError("unexpected value. true or false expected")
+BOOLEAN_VALUES = {"true": True, "false": False}
 
 
-def traverse(nodes):
-    for node in nodes:
-        yield node
-        yield from traverse(node.children)
+def boolean_spec(argument: Any) -> bool:
+    try:
+        return BOOLEAN_VALUES[argument]
+    except KeyError:
+        raise ValueError("unexpected value. true or false expected")
 
 
 class DrawIOBase(SphinxDirective):
@@ -99,13 +104,10 @@ class DrawIOBase(SphinxDirective):
     }
 
     def run(self) -> List[Node]:
-        nodes = super().run()
-        for node in traverse(nodes):
-            if isinstance(node, docutils_image):
-                image = node
-                break
-        image["classes"].append("drawio")
-        return nodes
+        # Image.run() turns the :class: option into the image node's classes,
+        # so the node is tagged for the converter without searching for it.
+        self.options["class"] = [*self.options.get("class", []), "drawio"]
+        return super().run()
 
 
 class DrawIOImage(DrawIOBase, Image):
@@ -124,6 +126,107 @@ OPTIONAL_UNIQUES = {
 }
 
 
+EXPORT_ARGS = ("--export", "--crop")
+
+# Number of lines of draw.io's stderr kept to report errors
+STDERR_TAIL_LINES = 64
+
+
+def find_drawio_binary(config: Config) -> str:
+    drawio_in_path = shutil.which("drawio")
+    draw_dot_io_in_path = shutil.which("draw.io")
+    WINDOWS_PATH = r"C:\Program Files\draw.io\draw.io.exe"
+    MACOS_PATH = "/Applications/draw.io.app/Contents/MacOS/draw.io"
+    LINUX_PATH = "/opt/drawio/drawio"
+    LINUX_OLD_PATH = "/opt/draw.io/drawio"
+
+    if config.drawio_binary_path:
+        return config.drawio_binary_path
+    elif drawio_in_path:
+        return drawio_in_path
+    elif draw_dot_io_in_path:
+        return draw_dot_io_in_path
+    elif _SYSTEM == "Windows" and os.path.isfile(WINDOWS_PATH):
+        return WINDOWS_PATH
+    elif _SYSTEM == "Darwin" and os.path.isfile(MACOS_PATH):
+        return MACOS_PATH
+    elif _SYSTEM == "Linux" and os.path.isfile(LINUX_PATH):
+        return LINUX_PATH
+    elif _SYSTEM == "Linux" and os.path.isfile(LINUX_OLD_PATH):
+        return LINUX_OLD_PATH
+    else:
+        raise DrawIOError("No drawio executable found")
+
+
+def electron_args(config: Config) -> Tuple[str, ...]:
+    args = []
+
+    if not config.drawio_disable_verbose_electron:
+        args.append("--enable-logging")
+
+    if config.drawio_disable_dev_shm_usage:
+        args.append("--disable-dev-shm-usage")
+
+    if config.drawio_disable_gpu:
+        args.append("--disable-gpu")
+        args.append("--disable-software-rasterizer")
+        args.append("--disable-features=DefaultPassthroughCommandDecoder")
+
+    if config.drawio_no_sandbox:
+        # This may be needed for docker support, and it has to be the last argument to work.
+        args.append("--no-sandbox")
+
+    return tuple(args)
+
+
+class DrawIOJob(NamedTuple):
+    """A pending export of a single draw.io file."""
+
+    input_abspath: str
+    export_abspath: str
+    # Every argument which is not a path, so jobs can be grouped together
+    export_args: Tuple[str, ...]
+    # Describes the input file, stored next to the export once it succeeds
+    input_meta: Dict[str, Any]
+    # Identifies the export in the build's cache of checked exports
+    cache_key: Tuple[str, ...]
+
+
+# Below this size, reading the file is cheaper than setting up a mmap
+MMAP_THRESHOLD = 64 * 1024
+
+
+def file_digest(path: str) -> str:
+    digest = blake2b(digest_size=20)
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size < MMAP_THRESHOLD:
+            digest.update(fp.read())
+        else:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+    return digest.hexdigest()
+
+
+def meta_path_for(export_abspath: str) -> str:
+    export_dir, export_name = os.path.split(export_abspath)
+    return os.path.join(export_dir, f".{export_name}.meta.json")
+
+
+def read_meta(meta_path: str) -> Dict[str, Any]:
+    try:
+        with open(meta_path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_meta(meta_path: str, meta: Dict[str, Any]) -> None:
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fp:
+        json.dump(meta, fp)
+    os.replace(tmp_path, meta_path)
+
+
 class DrawIOConverter(ImageConverter):
     conversion_rules = [
         # automatic conversion based on the builder's supported image types
@@ -140,9 +243,21 @@ class DrawIOConverter(ImageConverter):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
-        format = self.config.drawio_builder_export_format.get(self.app.builder.name)
+        builder = self.app.builder
+        # A converter is created for every document, but the builder's
+        # format only needs to be looked up and validated once
+        if not hasattr(builder, "_drawio_export_format"):
+            format = self.config.drawio_builder_export_format.get(builder.name)
+            builder._drawio_export_format = is_valid_format(format, builder)
+
+        self._default_export_format = builder._drawio_export_format
 
-        self._default_export_format = is_valid_format(format, self.app.builder)
+        # Maps the values identifying an export to the (size, mtime_ns) of its
+        # input and the exported file. It only lives for the current build:
+        # the environment is pickled before the write phase fills it in.
+        if not hasattr(builder, "_drawio_cache"):
+            builder._drawio_cache = {}
+        self._cache = builder._drawio_cache
 
     @property
     def imagedir(self) -> str:
@@ -152,6 +267,13 @@ class DrawIOConverter(ImageConverter):
         """Confirms the converter is available or not."""
         return True
 
+    def apply(self, **kwargs: Any) -> None:
+        # Exports are queued by handle() and run once every image is known,
+        # which lets a single draw.io launch export several files.
+        self._pending_exports: Dict[str, DrawIOJob] = {}
+        super().apply(**kwargs)
+        self._export_pending()
+
     def guess_mimetypes(self, node: nodes.image) -> List[str]:
         if "drawio" in node["classes"]:
             node_format = is_valid_format(node.get("format"), self.app.builder)
@@ -170,13 +292,13 @@ class DrawIOConverter(ImageConverter):
         else:
             srcpath = node["candidates"]["*"]
 
-        abs_srcpath = Path(self.app.srcdir) / srcpath
+        abs_srcpath = os.path.join(self.app.srcdir, srcpath)
         if not os.path.exists(abs_srcpath):
             return
 
         options = node.attributes
         out_filename = get_filename_for(srcpath, _to)
-        destpath = str(self._drawio_export(abs_srcpath, options, out_filename))
+        destpath = self._drawio_export(abs_srcpath, options, out_filename)
         if "*" in node["candidates"]:
             node["candidates"]["*"] = destpath
         else:
@@ -200,14 +322,13 @@ class DrawIOConverter(ImageConverter):
         raise DrawIOError(f"draw.io file {input_abspath} has no diagram named: {name}")
 
     @staticmethod
-    def num_pages_in_file(input_abspath: Path) -> int:
+    def num_pages_in_file(input_abspath: str) -> int:
         # Each diagram/page is a direct child of the root element
         return len(ET.parse(input_abspath).getroot())
 
-    def _drawio_export(self, input_abspath, options, out_filename):
+    def _drawio_export(self, input_abspath: str, options, out_filename: str) -> str:
         builder = self.app.builder
-        input_relpath = input_abspath.relative_to(builder.srcdir)
-        input_stem = input_abspath.stem
+        input_relpath = os.path.relpath(input_abspath, builder.srcdir)
 
         page_name = options.get("page-name", None)
         page_index = options.get("page-index", None)
@@ -234,57 +355,68 @@ class DrawIOConverter(ImageConverter):
         transparent = options.get(
             "transparency", builder.config.drawio_default_transparency
         )
-        disable_verbose_electron = builder.config.drawio_disable_verbose_electron
-        disable_dev_shm_usage = builder.config.drawio_disable_dev_shm_usage
-        disable_gpu = builder.config.drawio_disable_gpu
-        no_sandbox = builder.config.drawio_no_sandbox
+
+        optional_values = []
+        extra_args = []
+        for option, drawio_arg in OPTIONAL_UNIQUES.items():
+            value = options.get(option)
+            if value is None:
+                optional_values.append("")
+            else:
+                optional_values.append(str(value))
+                extra_args += (f"--{drawio_arg}", str(value))
 
         # Any directive options which would change the output file would go here
         unique_values = (
             # This ensures that the same file hash is generated no matter the build directory
             # Mainly useful for pytest, as it creates a new build directory every time
-            str(input_relpath),
+            input_relpath,
             page_index,
             scale,
             "true" if transparent else "false",
-            *[str(options.get(option)) for option in OPTIONAL_UNIQUES],
+            *optional_values,
         )
-        hash_key = "\n".join(unique_values)
-        sha_key = sha1(hash_key.encode()).hexdigest()
-        export_abspath = Path(self.imagedir) / sha_key / out_filename
-        export_abspath.parent.mkdir(parents=True, exist_ok=True)
-        export_relpath = export_abspath.relative_to(builder.doctreedir)
-        output_format = export_abspath.suffix[1:]
-
-        if (
-            export_abspath.exists()
-            and export_abspath.stat().st_mtime > input_abspath.stat().st_mtime
-        ):
+        # Within a build, an unchanged input skips all of the checks below
+        cache_key = (*unique_values, out_filename)
+        input_stat = os.stat(input_abspath)
+        input_id = (input_stat.st_size, input_stat.st_mtime_ns)
+        cached = self._cache.get(cache_key)
+        if cached is not None and cached[0] == input_id and os.path.exists(cached[1]):
+            return cached[1]
+
+        hash_key = blake2b(digest_size=20)
+        for value in unique_values:
+            hash_key.update(value.encode())
+            hash_key.update(b"\0")
+        export_dir = os.path.join(self.imagedir, hash_key.hexdigest())
+        os.makedirs(export_dir, exist_ok=True)
+        export_abspath = os.path.join(export_dir, out_filename)
+        export_relpath = os.path.relpath(export_abspath, builder.doctreedir)
+        output_format = os.path.splitext(out_filename)[1][1:]
+
+        # The export is reused when the input's size and mtime are unchanged,
+        # or failing that, when its content still has the same hash. This
+        # keeps the cache valid when mtimes are reset, e.g. by a fresh checkout.
+        meta_path = meta_path_for(export_abspath)
+        meta = read_meta(meta_path)
+        if meta:
+            try:
+                os.stat(export_abspath)
+            except FileNotFoundError:
+                meta = {}
+        input_meta = {
+            "input_size": input_stat.st_size,
+            "input_mtime_ns": input_stat.st_mtime_ns,
+        }
+        if all(meta.get(key) == value for key, value in input_meta.items()):
+            self._cache[cache_key] = (input_id, export_abspath)
             return export_abspath
 
-        drawio_in_path = shutil.which("drawio")
-        draw_dot_io_in_path = shutil.which("draw.io")
-        WINDOWS_PATH = r"C:\Program Files\draw.io\draw.io.exe"
-        MACOS_PATH = "/Applications/draw.io.app/Contents/MacOS/draw.io"
-        LINUX_PATH = "/opt/drawio/drawio"
-        LINUX_OLD_PATH = "/opt/draw.io/drawio"
-
-        if builder.config.drawio_binary_path:
-            binary_path = builder.config.drawio_binary_path
-        elif drawio_in_path:
-            binary_path = drawio_in_path
-        elif draw_dot_io_in_path:
-            binary_path = draw_dot_io_in_path
-        elif platform.system() == "Windows" and os.path.isfile(WINDOWS_PATH):
-            binary_path = WINDOWS_PATH
-        elif platform.system() == "Darwin" and os.path.isfile(MACOS_PATH):
-            binary_path = MACOS_PATH
-        elif platform.system() == "Linux" and os.path.isfile(LINUX_PATH):
-            binary_path = LINUX_PATH
-        elif platform.system() == "Linux" and os.path.isfile(LINUX_OLD_PATH):
-            binary_path = LINUX_OLD_PATH
-        else:
-            raise DrawIOError("No drawio executable found")
+        input_meta["input_digest"] = file_digest(input_abspath)
+        job = DrawIOJob(input_abspath, export_abspath, (), input_meta, cache_key)
+        if meta.get("input_digest") == input_meta["input_digest"]:
+            self._record_export(job)
+            return export_abspath
 
         scale_args = ["--scale", scale]
         if output_format == "pdf" and float(scale) == 1.0:
@@ -292,59 +424,155 @@ class DrawIOConverter(ImageConverter):
             # This is fixed now, but is left in for backwards compat.
             scale_args.clear()
 
-        extra_args = []
-        for option, drawio_arg in OPTIONAL_UNIQUES.items():
-            if option in options:
-                value = options[option]
-                extra_args.append(f"--{drawio_arg}")
-                extra_args.append(str(value))
-
         if transparent:
             extra_args.append("--transparent")
 
-        drawio_args = [
-            binary_path,
-            "--export",
-            "--crop",
+        export_args = (
             "--page-index",
             page_index,
             *scale_args,
             *extra_args,
             "--format",
             output_format,
-            "--output",
-            str(export_abspath),
-            str(input_abspath),
-        ]
+        )
 
-        if not disable_verbose_electron:
-            drawio_args.append("--enable-logging")
+        logger.info(f"(drawio) '{input_relpath}' -> '{export_relpath}'")
+        self._pending_exports[export_abspath] = job._replace(export_args=export_args)
+        return export_abspath
 
-        if disable_dev_shm_usage:
-            drawio_args.append("--disable-dev-shm-usage")
+    def _export_pending(self) -> None:
+        groups: Dict[Tuple[str, ...], List[DrawIOJob]] = {}
+        for job in self._pending_exports.values():
+            groups.setdefault(job.export_args, []).append(job)
+        self._pending_exports.clear()
 
-        if disable_gpu:
-            drawio_args.append("--disable-gpu")
-            drawio_args.append("--disable-software-rasterizer")
-            drawio_args.append("--disable-features=DefaultPassthroughCommandDecoder")
+        if not groups:
+            return
+        elif len(groups) == 1:
+            ((export_args, jobs),) = groups.items()
+            self._export_group(export_args, jobs)
+            return
 
-        if no_sandbox:
-            # This may be needed for docker support, and it has to be the last argument to work.
-            drawio_args.append("--no-sandbox")
+        # The exports have to be on disk before this returns, as the document
+        # is written straight after (the HTML writer reads the image to apply
+        # :scale:) and Sphinx has no hook between the write phase and
+        # Builder.finish() where they could be awaited for the whole build.
+        # So only the groups of this document run concurrently. Each draw.io
+        # run is a separate process, so threads are enough to keep them busy.
+        max_workers = self.config.drawio_jobs or os.cpu_count()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(self._export_group, export_args, jobs)
+                for export_args, jobs in groups.items()
+            ]
+
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except DrawIOError as exc:
+                errors.append(exc)
+        if len(errors) == 1:
+            raise errors[0]
+        elif errors:
+            raise DrawIOError("\n\n".join(str(exc) for exc in errors))
+
+    def _export_group(self, export_args: Tuple[str, ...], jobs: List[DrawIOJob]):
+        if len(jobs) > 1:
+            try:
+                jobs = self._export_batch(export_args, jobs)
+            except DrawIOError as exc:
+                # The per-file exports below report any genuine error
+                logger.verbose(f"(drawio) batch export failed: {exc}")
+        for job in jobs:
+            self._export_single(job)
+
+    def _export_batch(
+        self, export_args: Tuple[str, ...], jobs: List[DrawIOJob]
+    ) -> List[DrawIOJob]:
+        """Export all jobs sharing the same arguments with one draw.io run.
+
+        draw.io exports every file of a folder when given one as input. The
+        jobs which did not produce an output are returned to be retried.
+        """
+        with TemporaryDirectory(dir=self.imagedir) as tmpdir:
+            input_dir = os.path.join(tmpdir, "input")
+            output_dir = os.path.join(tmpdir, "output")
+            os.mkdir(input_dir)
+            os.mkdir(output_dir)
+            # Numbered copies avoid clashes between inputs with the same name
+            for index, job in enumerate(jobs):
+                shutil.copyfile(
+                    job.input_abspath, os.path.join(input_dir, f"{index}.drawio")
+                )
 
-        new_env = os.environ.copy()
-        if builder.config._display:
-            new_env["DISPLAY"] = f":{builder.config._display}"
+            self._run_drawio(self._drawio_args(export_args, output_dir, input_dir))
 
-        # This environment variable prevents the drawio application from starting.
-        # This is automatically set within certain Visual Studio Code contexts,
-        # such as for the reStructuredText (sphinx) preview.
-        new_env.pop("ELECTRON_RUN_AS_NODE", None)
+            missing = []
+            for index, job in enumerate(jobs):
+                output = os.path.join(
+                    output_dir, str(index) + os.path.splitext(job.export_abspath)[1]
+                )
+                if os.path.exists(output):
+                    os.replace(output, job.export_abspath)
+                    self._record_export(job)
+                else:
+                    missing.append(job)
+        return missing
+
+    def _export_single(self, job: DrawIOJob) -> None:
+        # Exporting to a temporary file means a partially written export is
+        # never visible under its final name
+        export_dir, export_name = os.path.split(job.export_abspath)
+        tmp_abspath = os.path.join(export_dir, f".tmp.{os.getpid()}.{export_name}")
+        drawio_args = self._drawio_args(job.export_args, tmp_abspath, job.input_abspath)
+        try:
+            stderr = self._run_drawio(drawio_args)
+            if not os.path.exists(tmp_abspath):
+                raise DrawIOError(
+                    "draw.io ({args}) did not produce an output file:"
+                    "\n[stderr]\n{stderr}".format(
+                        args=" ".join(drawio_args), stderr=stderr
+                    )
+                )
+            os.replace(tmp_abspath, job.export_abspath)
+        finally:
+            if os.path.exists(tmp_abspath):
+                os.remove(tmp_abspath)
+        self._record_export(job)
+
+    def _record_export(self, job: DrawIOJob) -> None:
+        write_meta(meta_path_for(job.export_abspath), job.input_meta)
+        input_id = (job.input_meta["input_size"], job.input_meta["input_mtime_ns"])
+        self._cache[job.cache_key] = (input_id, job.export_abspath)
+
+    def _drawio_args(
+        self, export_args: Tuple[str, ...], output: str, input: str
+    ) -> List[str]:
+        config = self.app.builder.config
+        # Resolved on first use rather than at config-inited, as the tests
+        # still change config values after that event
+        if getattr(config, "_drawio_base_args", None) is None:
+            config._drawio_base_args = (find_drawio_binary(config), *EXPORT_ARGS)
+            config._drawio_electron_args = electron_args(config)
+
+        return [
+            *config._drawio_base_args,
+            *export_args,
+            "--output",
+            output,
+            input,
+            *config._drawio_electron_args,
+        ]
 
-        logger.info(f"(drawio) '{input_relpath}' -> '{export_relpath}'")
+    def _run_drawio(self, drawio_args: List[str]) -> str:
+        """Run draw.io and return the last lines it wrote to stderr."""
         try:
-            ret = subprocess.run(
-                drawio_args, stderr=PIPE, stdout=PIPE, check=True, env=new_env
+            process = Popen(
+                drawio_args,
+                stdout=DEVNULL,
+                stderr=PIPE,
+                env=self.config._drawio_env,
             )
         except OSError as exc:
             raise DrawIOError(
@@ -352,69 +580,125 @@ class DrawIOConverter(ImageConverter):
                     args=" ".join(drawio_args), exc=exc
                 )
             )
-        except subprocess.CalledProcessError as exc:
+
+        # Electron is very verbose, only the end is useful to report errors
+        with process:
+            stderr_tail = deque(process.stderr, maxlen=STDERR_TAIL_LINES)
+            returncode = process.wait()
+        stderr = b"".join(stderr_tail).decode(errors="replace")
+
+        if returncode != 0:
             raise DrawIOError(
                 "draw.io ({args}) exited with error:\n[stderr]\n{stderr}"
-                "\n[stdout]\n{stdout}\n[returncode]\n{returncode}".format(
-                    args=" ".join(drawio_args),
-                    stderr=exc.stderr,
-                    stdout=exc.stdout,
-                    returncode=exc.returncode,
-                )
-            )
-        if not export_abspath.exists():
-            raise DrawIOError(
-                "draw.io ({args}) did not produce an output file:"
-                "\n[stderr]\n{stderr}\n[stdout]\n{stdout}".format(
-                    args=" ".join(drawio_args), stderr=ret.stderr, stdout=ret.stdout
+                "\n[returncode]\n{returncode}".format(
+                    args=" ".join(drawio_args), stderr=stderr, returncode=returncode
                 )
             )
-        return export_abspath
+        return stderr
+
+
+# Seconds to wait for Xvfb to be ready
+XVFB_START_TIMEOUT = 10
+
+
+def read_log(fp: IO[bytes]) -> str:
+    fp.seek(0)
+    return fp.read().decode(errors="replace")
 
 
 def on_config_inited(app: Sphinx, config: Config) -> None:
-    if is_headless(config):
+    jobs = config.drawio_jobs
+    if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+        raise DrawIOError(f"drawio_jobs must be a positive integer, not {jobs!r}")
+
+    # Resolved once, on_build_finished reads this flag to stop Xvfb
+    config._headless = is_headless(config)
+    if config._headless:
         logger.info("running in headless mode, starting Xvfb")
-        with TemporaryFile() as fp:
-            fd = fp.fileno()
-            xvfb = Popen(
-                ["Xvfb", "-displayfd", str(fd), "-screen", "0", "1280x768x16"],
-                pass_fds=(fd,),
-                stdout=PIPE,
-                stderr=PIPE,
-            )
-            if xvfb.poll() is not None:
-                raise OSError(
-                    f"Failed to start Xvfb process"
-                    "\n[stdout]\n{}\n[stderr]{*xvfb.communicate()}"
+        # Xvfb's output goes to a file, as pipes which are never read would
+        # eventually fill up and block it in the middle of a build
+        xvfb_log = TemporaryFile()
+        try:
+            with TemporaryFile() as fp:
+                fd = fp.fileno()
+                xvfb = Popen(
+                    ["Xvfb", "-displayfd", str(fd), "-screen", "0", "1280x768x16"],
+                    pass_fds=(fd,),
+                    stdout=DEVNULL,
+                    stderr=xvfb_log,
                 )
-            while fp.tell() == 0:
-                sleep(0.01)  # wait for Xvfb to start up
-            fp.seek(0)
-            config._xvfb = xvfb
-            config._display = fp.read().decode("ascii").strip()
+                # Xvfb writes the display number once it accepts connections
+                deadline = monotonic() + XVFB_START_TIMEOUT
+                while fp.tell() == 0:
+                    if xvfb.poll() is not None:
+                        raise OSError(
+                            "Failed to start Xvfb process"
+                            f"\n[stderr]\n{read_log(xvfb_log)}"
+                        )
+                    if monotonic() > deadline:
+                        xvfb.kill()
+                        xvfb.wait()
+                        raise OSError(
+                            f"Xvfb did not start within {XVFB_START_TIMEOUT} seconds"
+                            f"\n[stderr]\n{read_log(xvfb_log)}"
+                        )
+                    sleep(0.01)
+                fp.seek(0)
+                config._xvfb = xvfb
+                config._xvfb_log = xvfb_log
+                config._display = fp.read().decode("ascii").strip()
+        except BaseException:
+            # Once started, the log is closed in on_build_finished
+            xvfb_log.close()
+            raise
         logger.info(f"Xvfb is running on display :{config._display}")
     else:
         logger.info("running in non-headless mode, not starting Xvfb")
         config._xvfb = None
+        config._xvfb_log = None
         config._display = None
 
+    # Built once and shared by every draw.io run
+    drawio_env = os.environ.copy()
+    if config._display:
+        drawio_env["DISPLAY"] = f":{config._display}"
+
+    # This environment variable prevents the drawio application from starting.
+    # This is automatically set within certain Visual Studio Code contexts,
+    # such as for the reStructuredText (sphinx) preview.
+    drawio_env.pop("ELECTRON_RUN_AS_NODE", None)
+    config._drawio_env = drawio_env
+
+
+def is_up_to_date(src: str, dst: str) -> bool:
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    src_stat = os.stat(src)
+    return (
+        dst_stat.st_size == src_stat.st_size
+        and dst_stat.st_mtime_ns >= src_stat.st_mtime_ns
+    )
+
 
 def on_build_finished(app: Sphinx, exc: Exception) -> None:
     if exc is None:
         this_file_path = os.path.dirname(os.path.realpath(__file__))
         src = os.path.join(this_file_path, "drawio.css")
         dst = os.path.join(app.outdir, "_static")
-        copy_asset(src, dst)
+        if not is_up_to_date(src, os.path.join(dst, "drawio.css")):
+            copy_asset(src, dst)
 
-    if app.config._xvfb:
+    if app.config._headless:
         app.config._xvfb.terminate()
-        stdout, stderr = app.config._xvfb.communicate()
-        if app.config._xvfb.poll() != 0:
-            raise OSError(
-                f"Encountered an issue while terminating Xvfb"
-                "\n[stdout]\n{stdout}\n[stderr]{stderr}"
-            )
+        returncode = app.config._xvfb.wait()
+        with app.config._xvfb_log as xvfb_log:
+            if returncode != 0:
+                raise OSError(
+                    "Encountered an issue while terminating Xvfb"
+                    f"\n[stderr]\n{read_log(xvfb_log)}"
+                )
 
 
 def setup(app: Sphinx) -> Dict[str, Any]:
@@ -439,10 +723,15 @@ def setup(app: Sphinx) -> Dict[str, Any]:
     )
     app.add_config_value("drawio_disable_gpu", False, "html", ENUM(True, False))
     app.add_config_value("drawio_no_sandbox", False, "html", ENUM(True, False))
+    app.add_config_value("drawio_jobs", None, "", [int])
 
     # Add CSS file to the HTML static path for add_css_file
     app.connect("build-finished", on_build_finished)
     app.connect("config-inited", on_config_inited)
     app.add_css_file("drawio.css")
 
-    return {"version": __version__, "parallel_read_safe": True}
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import pytest
+
+from sphinx.application import Sphinx
+from sphinxcontrib.drawio import DrawIOConverter, DrawIOError
+
+
+def _record_runs(
+    monkeypatch, batch_run: Optional[Callable[[], str]] = None
+) -> List[Tuple[bool, str]]:
+    """Records (is a folder-mode run, input name) for every draw.io run
+
+    ``batch_run`` replaces the folder-mode runs when given.
+    """
+    runs = []
+    run_drawio = DrawIOConverter._run_drawio
+
+    def record(self, drawio_args):
+        # The input follows the output, see DrawIOConverter._drawio_args
+        input = drawio_args[drawio_args.index("--output") + 2]
+        is_batch = os.path.isdir(input)
+        runs.append((is_batch, os.path.basename(input)))
+        if is_batch and batch_run is not None:
+            return batch_run()
+        return run_drawio(self, drawio_args)
+
+    monkeypatch.setattr(DrawIOConverter, "_run_drawio", record)
+    return runs
+
+
+def _exported_images(app: Sphinx) -> List[str]:
+    return sorted(os.listdir(Path(app.outdir) / "_images"))
+
+
+@pytest.mark.sphinx("html", testroot="batch", srcdir="batch")
+def test_batch(app_with_local_user_config: Sphinx, monkeypatch):
+    runs = _record_runs(monkeypatch)
+    app_with_local_user_config.build()
+    # Both files share the same arguments, so one folder-mode run exports them
+    assert runs == [(True, "input")]
+    assert _exported_images(app_with_local_user_config) == ["box.png", "circle.png"]
+
+
+def _check_fallback(app: Sphinx, monkeypatch, batch_run: Callable[[], str]):
+    runs = _record_runs(monkeypatch, batch_run)
+    app.build()
+    # Each file is then exported on its own
+    batch, *singles = runs
+    assert batch == (True, "input")
+    assert sorted(singles) == [(False, "box.drawio"), (False, "circle.drawio")]
+    assert _exported_images(app) == ["box.png", "circle.png"]
+
+
+@pytest.mark.sphinx("html", testroot="batch", srcdir="batch_error")
+def test_batch_error(app_with_local_user_config: Sphinx, monkeypatch):
+    def fail():
+        raise DrawIOError("batch export failed")
+
+    _check_fallback(app_with_local_user_config, monkeypatch, fail)
+
+
+@pytest.mark.sphinx("html", testroot="batch", srcdir="batch_missing_output")
+def test_batch_missing_output(app_with_local_user_config: Sphinx, monkeypatch):
+    # The run succeeds without producing any output
+    _check_fallback(app_with_local_user_config, monkeypatch, lambda: "")
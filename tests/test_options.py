@@ -148,3 +148,13 @@ def test_page_name_and_page_index_config(app_with_local_user_config):
         app_with_local_user_config.build()
     (message,) = exc.value.args
     assert message == "page-name & page-index cannot coexist"
+
+
+@pytest.mark.parametrize("jobs", [0, -1])
+@pytest.mark.sphinx("html", testroot="image")
+def test_bad_jobs_config(app_params, make_app, jobs):
+    args, kwargs = app_params
+    with pytest.raises(DrawIOError) as exc:
+        make_app(*args, confoverrides={"drawio_jobs": jobs}, **kwargs)
+    (message,) = exc.value.args
+    assert message == f"drawio_jobs must be a positive integer, not {jobs}"
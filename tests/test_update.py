@@ -1,3 +1,4 @@
+import os
 import shutil
 
 from pathlib import Path
@@ -29,3 +30,16 @@ def test_image_changed(content: Sphinx, make_app_with_local_user_config):
     app = make_app_with_local_user_config(srcdir=content.srcdir)
     app.build()
     assert exported.stat().st_mtime > exported_timestamp
+
+
+@pytest.mark.sphinx("html", testroot="image", srcdir="image_touched")
+def test_image_touched(content: Sphinx, make_app_with_local_user_config):
+    box = Path(content.srcdir / "box.drawio")
+    (exported,) = Path(content.doctreedir / "drawio").glob("*/box.svg")
+    exported_timestamp = exported.stat().st_mtime_ns
+    # Only the mtime changes, e.g. after a fresh checkout
+    box_stat = box.stat()
+    os.utime(box, ns=(box_stat.st_atime_ns, box_stat.st_mtime_ns + 10**9))
+    app = make_app_with_local_user_config(srcdir=content.srcdir)
+    app.build()
+    assert exported.stat().st_mtime_ns == exported_timestamp